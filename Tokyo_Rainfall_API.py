@@ -1,16 +1,28 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.templating import Jinja2Templates
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
-import pytz
 import os
-import requests
+import httpx
+import asyncio
+import orjson
+import hashlib
+import gzip
+import random
 import time
+import math
+import logging
 from pathlib import Path
+from collections import OrderedDict
+from urllib.parse import parse_qs
+from email.utils import parsedate_to_datetime
 
 # Load environment variables
 # Try to load from local file first, but don't fail if it doesn't exist (for Render deployment)
@@ -24,37 +36,147 @@ except:
 LAT = os.getenv("LAT", "35.6895")
 LON = os.getenv("LON", "139.6917")
 API_KEY = os.getenv("OPENWEATHER_API_KEY")
+TOKYO_TZ = ZoneInfo("Asia/Tokyo")
 
-# Debug: Print environment variables (without showing the full API key)
-print(f"🔧 Environment check:")
-print(f"   LAT = {LAT}")
-print(f"   LON = {LON}")
-print(f"   API_KEY = {'✅ Set' if API_KEY else '❌ Missing'}")
+# uvicorn only configures its own loggers, and each worker process imports this module itself.
+# basicConfig does nothing if logging was already set up elsewhere.
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+# httpx logs every request URL at INFO, and OpenWeather URLs contain the API key
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Debug: Log environment variables (without showing the full API key)
+logger.info("🔧 Environment check: LAT = %s, LON = %s", LAT, LON)
 if API_KEY:
-    print(f"   API_KEY starts with: {API_KEY[:8]}...")
+    logger.info("   API_KEY = ✅ Set, starts with: %s...", API_KEY[:8])
+else:
+    logger.warning("   API_KEY = ❌ Missing")
 
 # Initialize FastAPI
 app = FastAPI()
 limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# Compress other text responses; the weather page is pre-compressed and passes through untouched
+# (Starlette 0.22+, i.e. fastapi>=0.88, skips responses that already set Content-Encoding)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+class VersionedStaticFiles(StaticFiles):
+    """Static files that browsers may keep for a year when requested with their current ?v= content hash"""
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        filename = os.path.relpath(full_path, os.path.realpath(self.directory))
+        # An old or made-up hash may not name this file's content, so it can't be kept forever
+        version = parse_qs(scope["query_string"].decode("latin-1")).get("v")
+        if version == [ASSET_VERSIONS.get(filename)]:
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "public, max-age=86400"
+        return response
+
+def asset_version(filename):
+    """Short content hash for cache-busting a file in static_images"""
+    return hashlib.blake2b((Path("static_images") / filename).read_bytes(), digest_size=4).hexdigest()
+
+# The page's CSS and JS only change on redeploy, so hash them once for their URLs
+ASSET_VERSIONS = {filename: asset_version(filename) for filename in ("rainfall.css", "rainfall.js")}
 
 # Serve static files
-app.mount("/static", StaticFiles(directory="static_images"), name="static")
+app.mount("/static", VersionedStaticFiles(directory="static_images"), name="static")
+
+# Page templates, compiled once at import (autoescaping is on for .html files)
+templates = Jinja2Templates(directory="templates")
+WEATHER_TEMPLATE = templates.get_template("weather.html")
+
+# Shared async HTTP client (keeps connections to OpenWeather alive between calls)
+client = httpx.AsyncClient(
+    timeout=httpx.Timeout(10, connect=3.05),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,  # Retry failed connects only
+        limits=httpx.Limits(max_connections=10, max_keepalive_connections=4)
+    )
+)
+
+@app.on_event("shutdown")
+async def close_connections():
+    # Stop refresh tasks first so none is mid-request when the clients close
+    for task in list(BACKGROUND_TASKS):
+        task.cancel()
+    await client.aclose()
+    if redis_client is not None:
+        await redis_client.aclose()
+
+OPENWEATHER_URLS = {
+    'weather': f"https://api.openweathermap.org/data/2.5/weather?lat={LAT}&lon={LON}&appid={API_KEY}&units=metric",
+    'forecast': f"https://api.openweathermap.org/data/2.5/forecast?lat={LAT}&lon={LON}&appid={API_KEY}&units=metric",
+    'air_pollution': f"https://api.openweathermap.org/data/2.5/air_pollution?lat={LAT}&lon={LON}&appid={API_KEY}"
+}
 
 # IMPROVED CACHING SYSTEM
 WEATHER_CACHE = {
     'data': None,
-    'timestamp': 0,
-    'in_progress': False  # Prevent duplicate requests
+    'timestamp': 0,  # Last time any part of the data changed
+    'expires': {},   # OpenWeather endpoint -> time its views go stale
+    'expires_at': 0, # Earliest of those, kept current so each request checks a single number
+    'failed_at': 0   # Last time a refresh got nothing at all from OpenWeather
+}
+# Each endpoint is cached for as long as its data actually stays current
+ENDPOINT_TTLS = {
+    'weather': 600,         # Current conditions (and sunrise/sunset): 10 minutes
+    'forecast': 10800,      # Rainfall and 5-day forecast come in 3-hour steps: 3 hours
+    'air_pollution': 3600   # Air quality: 1 hour
+}
+STALE_GRACE = 3600  # Keep serving expired data this long while a background refresh runs
+REFRESH_LOCK = asyncio.Lock()  # Prevent duplicate refreshes
+BACKGROUND_TASKS = set()  # Hold references so running refresh tasks aren't garbage collected
+REFRESH_JITTER = 30       # Spread the periodic refreshes of workers and replicas that started together
+REFRESH_RETRY_DELAY = 60  # Wait before retrying after a failed periodic refresh
+
+# Finished HTML (already UTF-8 encoded) for the data currently in WEATHER_CACHE
+RENDERED_CACHE = {
+    'html': None,
+    'etag': None,
+    'gzip': None,       # Same page compressed once at render time
+    'gzip_etag': None,
+    'timestamp': 0,  # WEATHER_CACHE timestamp the page was rendered from
+    'expires_at': 0  # Next Tokyo midnight, so the date header never goes stale
 }
-CACHE_DURATION = 21600  # 6 hours in seconds (longer cache)
+BROWSER_CACHE_DURATION = 3600  # Upper bound for the Cache-Control hint sent to browsers
+
+# Optional Redis cache shared by all workers; without REDIS_URL each worker caches on its own
+REDIS_URL = os.getenv("REDIS_URL")
+SHARED_CACHE_KEY = "tokyo:weather:v1"
+SHARED_LOCK_KEY = "tokyo:weather:v1:refresh-lock"
+SHARED_LOCK_TIMEOUT = 60  # Lock frees itself if the worker holding it dies mid-refresh
+SHARED_WAIT = 15          # How long to wait on another worker's refresh before fetching anyway
+REDIS_TIMEOUT = 2         # Seconds; an unreachable Redis must not stall refreshes held under REFRESH_LOCK
+redis_client = None
+if REDIS_URL:
+    import redis.asyncio as redis
+    redis_client = redis.from_url(REDIS_URL, socket_timeout=REDIS_TIMEOUT,
+                                  socket_connect_timeout=REDIS_TIMEOUT)
+
+def is_endpoint_fresh(endpoint):
+    """Check if the cached views from one OpenWeather endpoint are still valid"""
+    return time.time() < WEATHER_CACHE['expires'].get(endpoint, 0)
+
+def earliest_expiry(expires):
+    """Time at which the first endpoint in an expiry map goes stale"""
+    return min((expires.get(endpoint, 0) for endpoint in ENDPOINT_TTLS), default=0)
+
+def cache_expires_at():
+    """Time at which the first cached endpoint goes stale"""
+    return WEATHER_CACHE['expires_at']
 
 def is_cache_valid():
     """Check if cache is still valid"""
-    current_time = time.time()
-    return (WEATHER_CACHE['data'] is not None and 
-            current_time - WEATHER_CACHE['timestamp'] < CACHE_DURATION)
+    return WEATHER_CACHE['data'] is not None and time.time() < cache_expires_at()
+
+def is_cache_servable():
+    """Check if cached data is expired but still young enough to serve while refreshing"""
+    return WEATHER_CACHE['data'] is not None and time.time() < cache_expires_at() + STALE_GRACE
 
 def get_cache_status():
     """Get human-readable cache status"""
@@ -69,541 +191,625 @@ def get_cache_status():
     else:
         return "Cache expired"
 
+async def load_shared_cache():
+    """Adopt the Redis snapshot if another worker stored newer data.
+    Returns True if WEATHER_CACHE changed."""
+    if redis_client is None:
+        return False
+    try:
+        payload = await redis_client.get(SHARED_CACHE_KEY)
+    except redis.RedisError as e:
+        logger.warning("❌ Redis unavailable, using this worker's cache: %s", e)
+        return False
+    if payload is None:
+        return False
+    
+    previous = dict(WEATHER_CACHE)
+    try:
+        snapshot = orjson.loads(payload)
+        if snapshot['timestamp'] <= WEATHER_CACHE['timestamp']:
+            return False
+        WEATHER_CACHE['data'] = snapshot['data']
+        WEATHER_CACHE['timestamp'] = snapshot['timestamp']
+        WEATHER_CACHE['expires'] = snapshot['expires']
+        WEATHER_CACHE['expires_at'] = earliest_expiry(snapshot['expires'])
+        render_cached_page()
+    except (orjson.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+        # Corrupt, or written by an incompatible version: treat it as a miss and keep our own cache
+        WEATHER_CACHE.update(previous)
+        logger.warning("❌ Ignoring unreadable shared cache snapshot: %r", e)
+        return False
+    logger.info("📋 Loaded weather data from the shared cache")
+    return True
+
+async def store_shared_cache():
+    """Publish WEATHER_CACHE to Redis so the other workers can skip their own API calls"""
+    if redis_client is None:
+        return
+    snapshot = {
+        'data': WEATHER_CACHE['data'],
+        'timestamp': WEATHER_CACHE['timestamp'],
+        'expires': WEATHER_CACHE['expires']
+    }
+    try:
+        await redis_client.set(SHARED_CACHE_KEY, orjson.dumps(snapshot),
+                               ex=max(ENDPOINT_TTLS.values()) + STALE_GRACE)
+    except redis.RedisError as e:
+        logger.warning("❌ Could not store weather data in Redis: %s", e)
+
+async def acquire_shared_lock():
+    """Take the Redis refresh lock (SET NX) so only one worker calls OpenWeather.
+    Returns the lock, True if there is nothing to coordinate, or None if another worker holds it."""
+    if redis_client is None:
+        return True
+    lock = redis_client.lock(SHARED_LOCK_KEY, timeout=SHARED_LOCK_TIMEOUT)
+    try:
+        return lock if await lock.acquire(blocking=False) else None
+    except redis.RedisError as e:
+        logger.warning("❌ Redis unavailable, refreshing without the shared lock: %s", e)
+        return True
+
+async def release_shared_lock(lock):
+    if lock is None or lock is True:
+        return
+    try:
+        await lock.release()
+    except redis.RedisError as e:
+        # Usually the lock already timed out; it expires on its own either way
+        logger.warning("❌ Could not release the Redis refresh lock: %s", e)
+
+async def wait_for_shared_cache():
+    """Poll Redis while another worker refreshes. Returns True once its data arrives."""
+    deadline = time.monotonic() + SHARED_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.5)
+        if await load_shared_cache():
+            return True
+    return False
+
+# These payloads never change after startup, so serialize them once
+ROOT_JSON = orjson.dumps({"message": "Tokyo Weather API", "main_page": "/rainfall/formatted"})
+HEALTH_JSON = orjson.dumps({"status": "healthy", "api_key_loaded": bool(API_KEY)})
+
 # Root route - redirect to main weather page
 @app.get("/")
-def root():
-    return {"message": "Tokyo Weather API", "main_page": "/rainfall/formatted"}
+async def root():
+    return Response(content=ROOT_JSON, media_type="application/json")
 
 # Health check route
 @app.get("/health")
-def health_check():
-    return {"status": "healthy", "api_key_loaded": bool(API_KEY)}
+async def health_check():
+    return Response(content=HEALTH_JSON, media_type="application/json")
 
-def get_all_weather_data():
-    """Consolidated function that makes only 3 API calls instead of 5+"""
-    
-    # Check cache first
-    if is_cache_valid() and WEATHER_CACHE['data'] is not None:
-        print("📋 Using cached weather data")
-        return WEATHER_CACHE['data']
-    
-    # Prevent duplicate requests if one is already in progress
-    if WEATHER_CACHE['in_progress']:
-        print("⏳ Request in progress, waiting for cache...")
-        # Return existing data if available, even if expired
-        if WEATHER_CACHE['data'] is not None:
-            return WEATHER_CACHE['data']
-    
-    WEATHER_CACHE['in_progress'] = True
-    print("🔄 Fetching fresh weather data (consolidated)")
-    
+FETCH_ATTEMPTS = 3  # Tries per OpenWeather call before giving up
+RETRY_BASE_DELAY = 1  # Seconds before the first retry, doubled after each failure
+RETRY_MAX_DELAY = 8  # Never wait longer than this between tries
+
+def is_retryable(error):
+    """Network errors, rate limiting and server errors are worth retrying; other 4xx are not"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return True
+
+def describe_fetch_error(error):
+    """Short description of a failed OpenWeather call for the logs.
+    HTTP errors are reduced to their status code: httpx's own message includes the request URL,
+    which contains the API key."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"HTTP {error.response.status_code}"
+    return str(error) or error.__class__.__name__
+
+class RetryLater(Exception):
+    """OpenWeather asked us to wait longer than RETRY_MAX_DELAY before calling again"""
+    def __init__(self, retry_after):
+        super().__init__(f"OpenWeather asked to retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+def retry_after_seconds(error):
+    """Seconds the server asked us to wait (Retry-After as seconds or an HTTP date), or None"""
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    retry_after = error.response.headers.get("retry-after", "").strip()
+    if retry_after.isdigit():
+        return int(retry_after)
     try:
-        tokyo_tz = pytz.timezone("Asia/Tokyo")
-        now = datetime.now(tokyo_tz)
-        
-        # API Call 1: Current Weather (also has sunrise/sunset)
-        print("🌐 API Call 1/3: Current weather")
-        current_url = f"https://api.openweathermap.org/data/2.5/weather?lat={LAT}&lon={LON}&appid={API_KEY}&units=metric"
-        current_response = requests.get(current_url)
-        current_data = current_response.json()
-        
-        # API Call 2: 5-day Forecast (also has rainfall data)
-        print("🌐 API Call 2/3: 5-day forecast")
-        forecast_url = f"https://api.openweathermap.org/data/2.5/forecast?lat={LAT}&lon={LON}&appid={API_KEY}&units=metric"
-        forecast_response = requests.get(forecast_url)
-        forecast_data = forecast_response.json()
-        
-        # API Call 3: Air Quality
-        print("🌐 API Call 3/3: Air quality")
-        air_url = f"https://api.openweathermap.org/data/2.5/air_pollution?lat={LAT}&lon={LON}&appid={API_KEY}"
-        air_response = requests.get(air_url)
-        air_data = air_response.json()
-        
-        # Process Current Weather
-        current_weather = {
-            "temp": current_data["main"]["temp"],
-            "humidity": current_data["main"]["humidity"],
-            "wind_speed": current_data["wind"]["speed"],
-            "wind_deg": current_data["wind"].get("deg", 0),
-            "weather": current_data["weather"][0]["main"],
-            "description": current_data["weather"][0]["description"].capitalize(),
-            "icon": current_data["weather"][0]["icon"]
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)  # HTTP dates are always GMT
+    return max(retry_at.timestamp() - time.time(), 0)
+
+def retry_delay(error, attempt):
+    """Seconds to wait before the next try: the server's Retry-After, else exponential backoff with jitter"""
+    retry_after = retry_after_seconds(error)
+    if retry_after is not None:
+        return retry_after
+    return min(RETRY_BASE_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY) * random.uniform(0.5, 1)
+
+async def fetch_json(url):
+    """Fetch a URL with the shared client and decode the JSON body, retrying transient failures"""
+    for attempt in range(1, FETCH_ATTEMPTS + 1):
+        try:
+            response = await client.get(url)
+            response.raise_for_status()
+            return orjson.loads(response.content)
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            if not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt)
+            # Waiting that long here would hold REFRESH_LOCK; the cache retries this endpoint later instead
+            if delay > RETRY_MAX_DELAY:
+                raise RetryLater(delay) from e
+            if attempt == FETCH_ATTEMPTS:
+                raise
+            logger.warning("⚠️ OpenWeather call failed (%s), retrying in %.1fs", e.__class__.__name__, delay)
+            await asyncio.sleep(delay)
+
+def parse_current_weather(current_data):
+    """Build the current conditions view from a raw /weather response"""
+    return {
+        "temp": current_data["main"]["temp"],
+        "humidity": current_data["main"]["humidity"],
+        "wind_speed": current_data["wind"]["speed"],
+        "wind_deg": current_data["wind"].get("deg", 0),
+        "weather": current_data["weather"][0]["main"],
+        "description": current_data["weather"][0]["description"].capitalize(),
+        "icon": current_data["weather"][0]["icon"]
+    }
+
+MOON_PHASES = ("🌑", "🌒", "🌓", "🌔", "🌕", "🌖", "🌗", "🌘")
+SYNODIC_MONTH = 29.530588853  # Days from one new moon to the next
+KNOWN_NEW_MOON_JD = 2451550.1  # Julian date of the new moon on 2000-01-06
+
+def moon_phase(timestamp):
+    """Moon phase emoji for a Unix timestamp, from the moon's age in the synodic month"""
+    julian_date = timestamp / 86400 + 2440587.5
+    phase = ((julian_date - KNOWN_NEW_MOON_JD) % SYNODIC_MONTH) / SYNODIC_MONTH
+    # Round to the nearest of the 8 phases so each emoji is centred on its phase
+    return MOON_PHASES[int(phase * 8 + 0.5) % 8]
+
+def parse_sun_moon(current_data):
+    """Build the sunrise/sunset/moon view from the same raw /weather response"""
+    sunrise = datetime.fromtimestamp(current_data["sys"]["sunrise"], tz=TOKYO_TZ)
+    sunset = datetime.fromtimestamp(current_data["sys"]["sunset"], tz=TOKYO_TZ)
+
+    return {
+        "sunrise": sunrise.strftime("%H:%M"),
+        "sunset": sunset.strftime("%H:%M"),
+        "moon": moon_phase(current_data["sys"]["sunset"])
+    }
+
+def parse_rainfall_data(forecast_data, now):
+    """Build the rainfall view from a raw /forecast response"""
+    rainfall_forecast = []
+    current_rainfall = 0.0
+    now_ts = now.timestamp()
+
+    for item in forecast_data['list']:
+        # 'dt' is already a Unix timestamp, so compare numbers and only convert the rainy slots
+        if item['dt'] > now_ts:
+            rainfall = item.get('rain', {}).get('3h', 0.0)
+            if rainfall > 0:
+                dt_tokyo = datetime.fromtimestamp(item['dt'], tz=TOKYO_TZ)
+                rainfall_forecast.append({
+                    "timestamp": dt_tokyo.strftime('%Y-%m-%d %H:%M:%S JST%z'),
+                    "rainfall_3h_mm": rainfall
+                })
+
+    if forecast_data['list']:
+        last_rain = forecast_data['list'][0].get('rain', {}).get('3h', 0.0)
+        current_rainfall = last_rain
+
+    return {
+        "current_rainfall_last_hour_mm": current_rainfall,
+        "current_timestamp": now.strftime('%Y-%m-%d %H:%M:%S JST%z'),
+        "forecast": rainfall_forecast[:4]
+    }
+
+def parse_5day_forecast(forecast_data):
+    """Build the one-entry-per-day forecast view from a raw /forecast response"""
+    daily_data = {}
+    for item in forecast_data['list']:
+        # Group by the Tokyo calendar day ('dt_txt' is UTC, so its days start at 09:00 JST)
+        dt_tokyo = datetime.fromtimestamp(item['dt'], tz=TOKYO_TZ)
+        date = dt_tokyo.date()
+        if date not in daily_data:
+            daily_data[date] = {
+                "temp": item["main"]["temp"],
+                "description": item["weather"][0]["description"].capitalize(),
+                "icon": item["weather"][0]["icon"],
+                "date": dt_tokyo.strftime("%a, %b %d")
+            }
+
+    return list(daily_data.values())[:5]
+
+# (level, advice, color) for OpenWeather AQI 1-5, indexed by aqi - 1
+AQI_LEVELS = (
+    ("Good", "Air quality is satisfactory.", "#4CAF50"),
+    ("Fair", "Moderate quality.", "#8BC34A"),
+    ("Moderate", "Sensitive groups affected.", "#FFC107"),
+    ("Poor", "Unhealthy for some.", "#FF9800"),
+    ("Very Poor", "Health alert.", "#F44336")
+)
+AQI_UNKNOWN = ("Unknown", "No data", "#9E9E9E")
+
+def parse_air_quality(air_data):
+    """Build the air quality view from a raw /air_pollution response"""
+    aqi = air_data['list'][0]['main']['aqi']
+    level, advice, color = AQI_LEVELS[aqi - 1] if 1 <= aqi <= len(AQI_LEVELS) else AQI_UNKNOWN
+    return {
+        "aqi": aqi,
+        "level": level,
+        "advice": advice,
+        "color": color,
+        "components": air_data['list'][0]['components']
+    }
+
+def fallback_weather_data():
+    """Placeholder views shown when OpenWeather data is unavailable"""
+    return {
+        'current_weather': {
+            "temp": "N/A", "humidity": "N/A", "wind_speed": "N/A", 
+            "wind_deg": 0, "weather": "Unknown", "description": "Weather unavailable", "icon": "01d"
+        },
+        'sun_moon': {"sunrise": "N/A", "sunset": "N/A", "moon": "🌑"},
+        'rainfall_data': {
+            "current_rainfall_last_hour_mm": 0.0,
+            "current_timestamp": datetime.now(TOKYO_TZ).strftime('%Y-%m-%d %H:%M:%S JST%z'),
+            "forecast": []
+        },
+        'forecast': [],
+        'air_quality': {
+            "aqi": 0, "level": "Unknown", "advice": "No air quality data", 
+            "color": "#9E9E9E", "components": {}
         }
-        
-        # Process Sun/Moon Data (from current weather API)
-        sunrise = datetime.fromtimestamp(current_data["sys"]["sunrise"], tz=pytz.utc).astimezone(tokyo_tz)
-        sunset = datetime.fromtimestamp(current_data["sys"]["sunset"], tz=pytz.utc).astimezone(tokyo_tz)
-        moon_phases = ["🌑", "🌒", "🌓", "🌔", "🌕", "🌖", "🌗", "🌘"]
-        moon_phase = moon_phases[sunset.day % 8]
-        
-        sun_moon = {
-            "sunrise": sunrise.strftime("%H:%M"),
-            "sunset": sunset.strftime("%H:%M"),
-            "moon": moon_phase
+    }
+
+def parse_endpoint_views(endpoint, raw_data, now):
+    """Build every view that comes from one OpenWeather endpoint's response"""
+    if endpoint == 'weather':
+        # Current conditions and sun/moon views both come from the single weather response
+        return {
+            'current_weather': parse_current_weather(raw_data),
+            'sun_moon': parse_sun_moon(raw_data)
         }
-        
-        # Process Rainfall Data (from forecast API)
-        rainfall_forecast = []
-        current_rainfall = 0.0
-        
-        for item in forecast_data['list']:
-            dt_utc = datetime.strptime(item['dt_txt'], "%Y-%m-%d %H:%M:%S")
-            dt_utc = pytz.utc.localize(dt_utc)
-            dt_tokyo = dt_utc.astimezone(tokyo_tz)
-            if dt_tokyo > now:
-                rainfall = item.get('rain', {}).get('3h', 0.0)
-                if rainfall > 0:
-                    rainfall_forecast.append({
-                        "timestamp": dt_tokyo.strftime('%Y-%m-%d %H:%M:%S JST%z'),
-                        "rainfall_3h_mm": rainfall
-                    })
-        
-        if forecast_data['list']:
-            last_rain = forecast_data['list'][0].get('rain', {}).get('3h', 0.0)
-            current_rainfall = last_rain
-        
-        rainfall_data = {
-            "current_rainfall_last_hour_mm": current_rainfall,
-            "current_timestamp": now.strftime('%Y-%m-%d %H:%M:%S JST%z'),
-            "forecast": rainfall_forecast[:4]
+    if endpoint == 'forecast':
+        # Rainfall and 5-day views both come from the single forecast response
+        return {
+            'rainfall_data': parse_rainfall_data(raw_data, now),
+            'forecast': parse_5day_forecast(raw_data)
         }
+    return {'air_quality': parse_air_quality(raw_data)}
+
+async def fetch_all_weather_data():
+    """Call every expired OpenWeather endpoint at the same time and cache the views that succeed"""
+    now = datetime.now(TOKYO_TZ)
+    # Endpoints waiting out an earlier failure have a future expiry too, so they're skipped
+    stale_endpoints = [endpoint for endpoint in ENDPOINT_TTLS if not is_endpoint_fresh(endpoint)]
+    if not stale_endpoints:
+        raise RuntimeError("every OpenWeather endpoint is waiting out an earlier failure")
+    
+    # API Call 1: Current Weather (also has sunrise/sunset)
+    # API Call 2: 5-day Forecast (also has rainfall data)
+    # API Call 3: Air Quality
+    logger.info("🌐 API Calls: %s (concurrent)", ", ".join(stale_endpoints))
+    responses = await asyncio.gather(
+        *(fetch_json(OPENWEATHER_URLS[endpoint]) for endpoint in stale_endpoints),
+        return_exceptions=True
+    )
+    
+    # Start from the cached views (or placeholders) and replace the ones that were refetched
+    all_data = dict(WEATHER_CACHE['data'] or fallback_weather_data())
+    refreshed = []
+    failed = {}  # Endpoint -> seconds until it may be called again
+    
+    for endpoint, response in zip(stale_endpoints, responses):
+        # One failing endpoint keeps its previous views instead of blanking the whole page
+        try:
+            if isinstance(response, Exception):
+                raise response
+            all_data.update(parse_endpoint_views(endpoint, response, now))
+            refreshed.append(endpoint)
+        except Exception as e:
+            logger.error("❌ Error fetching %s data: %s", endpoint, describe_fetch_error(e))
+            retry_after = e.retry_after if isinstance(e, RetryLater) else 0
+            failed[endpoint] = max(retry_after, REFRESH_RETRY_DELAY)
+    
+    # A failed endpoint keeps its old views and is retried once per REFRESH_RETRY_DELAY (or after
+    # the server's Retry-After), instead of every visit finding the cache expired and refetching it
+    current_time = time.time()
+    for endpoint, retry_after in failed.items():
+        WEATHER_CACHE['expires'][endpoint] = current_time + retry_after
+    WEATHER_CACHE['expires_at'] = earliest_expiry(WEATHER_CACHE['expires'])
+    
+    if not refreshed:
+        raise RuntimeError("no OpenWeather endpoint could be refreshed")
+    
+    # Update cache
+    for endpoint in refreshed:
+        WEATHER_CACHE['expires'][endpoint] = current_time + ENDPOINT_TTLS[endpoint]
+    WEATHER_CACHE['expires_at'] = earliest_expiry(WEATHER_CACHE['expires'])
+    WEATHER_CACHE['data'] = all_data
+    WEATHER_CACHE['timestamp'] = current_time
+    render_cached_page()
+    await store_shared_cache()
+    
+    logger.info("✅ Weather data cached successfully (%s)", ", ".join(refreshed))
+    return all_data
+
+async def refresh_weather_data():
+    """Consolidated refresh that makes only 3 API calls, all at the same time.
+    Returns the new data, or None if the refresh failed."""
+    async with REFRESH_LOCK:
+        # Another request may have refreshed the cache while this one waited for the lock
+        if is_cache_valid():
+            return WEATHER_CACHE['data']
         
-        # Process 5-day Forecast (from forecast API)
-        daily_data = {}
-        for item in forecast_data['list']:
-            date = item['dt_txt'].split()[0]
-            if date not in daily_data:
-                daily_data[date] = {
-                    "temp": item["main"]["temp"],
-                    "description": item["weather"][0]["description"].capitalize(),
-                    "icon": item["weather"][0]["icon"],
-                    "date": datetime.strptime(date, "%Y-%m-%d").strftime("%a, %b %d")
-                }
-        
-        forecast = list(daily_data.values())[:5]
-        
-        # Process Air Quality
-        aqi = air_data['list'][0]['main']['aqi']
-        levels = {
-            1: ("Good", "Air quality is satisfactory.", "#4CAF50"),
-            2: ("Fair", "Moderate quality.", "#8BC34A"),
-            3: ("Moderate", "Sensitive groups affected.", "#FFC107"),
-            4: ("Poor", "Unhealthy for some.", "#FF9800"),
-            5: ("Very Poor", "Health alert.", "#F44336")
-        }
-        air_quality = {
-            "aqi": aqi,
-            "level": levels.get(aqi, ("Unknown", "No data", "#9E9E9E"))[0],
-            "advice": levels.get(aqi, ("Unknown", "No data", "#9E9E9E"))[1],
-            "color": levels.get(aqi, ("Unknown", "No data", "#9E9E9E"))[2],
-            "components": air_data['list'][0]['components']
-        }
+        # Another worker may have refreshed the shared cache already
+        if await load_shared_cache() and is_cache_valid():
+            return WEATHER_CACHE['data']
         
-        # Consolidate all data
-        all_data = {
-            'current_weather': current_weather,
-            'sun_moon': sun_moon,
-            'rainfall_data': rainfall_data,
-            'forecast': forecast,
-            'air_quality': air_quality
-        }
+        # The refresh this request queued behind just failed: don't run the whole fetch again
+        if time.time() < WEATHER_CACHE['failed_at'] + REFRESH_RETRY_DELAY:
+            return None
         
-        # Update cache
-        WEATHER_CACHE['data'] = all_data
-        WEATHER_CACHE['timestamp'] = time.time()
-        WEATHER_CACHE['in_progress'] = False
+        lock = await acquire_shared_lock()
+        # Another worker is calling OpenWeather right now: use its result instead
+        if lock is None and await wait_for_shared_cache():
+            return WEATHER_CACHE['data']
         
-        print("✅ All weather data cached successfully")
+        logger.info("🔄 Fetching fresh weather data (consolidated)")
+        try:
+            return await fetch_all_weather_data()
+        except Exception as e:
+            logger.error("❌ Error fetching weather data: %s", e)
+            WEATHER_CACHE['failed_at'] = time.time()
+            return None
+        finally:
+            await release_shared_lock(lock)
+
+def refresh_in_background():
+    """Start a refresh without waiting for it, unless one is already running"""
+    if REFRESH_LOCK.locked():
+        return
+    task = asyncio.create_task(refresh_weather_data())
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+
+async def refresh_periodically():
+    """Refresh each time the cache expires, so visitors don't have to trigger it"""
+    while True:
+        try:
+            await refresh_weather_data()
+        except Exception:
+            # Unexpected here, since refresh_weather_data handles fetch errors itself
+            logger.exception("❌ Error in periodic weather refresh")
+        delay = max(cache_expires_at() - time.time(), REFRESH_RETRY_DELAY)
+        await asyncio.sleep(delay + random.uniform(0, REFRESH_JITTER))
+
+@app.on_event("startup")
+async def start_periodic_refresh():
+    task = asyncio.create_task(refresh_periodically())
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+
+async def get_all_weather_data():
+    """Return cached data, serving it stale while a background refresh runs"""
+    
+    # Check cache first
+    if is_cache_valid():
+        logger.debug("📋 Using cached weather data")
+        return WEATHER_CACHE['data']
+    
+    # Recently expired: answer right away and let the refresh happen behind the scenes
+    if is_cache_servable():
+        logger.info("⏳ Serving stale weather data while refreshing in the background")
+        refresh_in_background()
+        return WEATHER_CACHE['data']
+    
+    # Nothing usable cached: this request has to wait for the refresh
+    all_data = await refresh_weather_data()
+    if all_data is not None:
         return all_data
-        
-    except Exception as e:
-        print(f"❌ Error fetching weather data: {e}")
-        WEATHER_CACHE['in_progress'] = False
-        
-        # Return fallback data
-        return {
-            'current_weather': {
-                "temp": "N/A", "humidity": "N/A", "wind_speed": "N/A", 
-                "wind_deg": 0, "weather": "Unknown", "description": "Weather unavailable", "icon": "01d"
-            },
-            'sun_moon': {"sunrise": "N/A", "sunset": "N/A", "moon": "🌑"},
-            'rainfall_data': {
-                "current_rainfall_last_hour_mm": 0.0,
-                "current_timestamp": datetime.now(pytz.timezone("Asia/Tokyo")).strftime('%Y-%m-%d %H:%M:%S JST%z'),
-                "forecast": []
-            },
-            'forecast': [],
-            'air_quality': {
-                "aqi": 0, "level": "Unknown", "advice": "No air quality data", 
-                "color": "#9E9E9E", "components": {}
-            }
-        }
+    
+    # Refresh failed: older or partial data still beats placeholders
+    if WEATHER_CACHE['data'] is not None:
+        return WEATHER_CACHE['data']
+    
+    return fallback_weather_data()
+
+def etag_matches(request, etag):
+    """Check if the browser's If-None-Match already names this version.
+    Uses weak comparison (RFC 9110), since proxies that re-encode the page mark its tag W/."""
+    if_none_match = request.headers.get("if-none-match", "")
+    opaque_tag = etag.removeprefix("W/")
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == opaque_tag:
+            return True
+    return False
+
+def cached_page_response(request):
+    """Return the rendered page as bytes, or 304 if the browser already has this version"""
+    current_time = time.time()
+    max_age = min(BROWSER_CACHE_DURATION,
+                  RENDERED_CACHE['expires_at'] - current_time,
+                  cache_expires_at() - current_time)
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    etag = RENDERED_CACHE['gzip_etag'] if use_gzip else RENDERED_CACHE['etag']
+    headers = {
+        "Cache-Control": f"public, max-age={max(int(max_age), 0)}",
+        "ETag": etag
+    }
+    
+    # GZipMiddleware adds "Vary: Accept-Encoding" to the plain page itself
+    if etag_matches(request, etag):
+        headers["Vary"] = "Accept-Encoding"
+        return Response(status_code=304, headers=headers)
+    
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+        return HTMLResponse(content=RENDERED_CACHE['gzip'], headers=headers)
+    return HTMLResponse(content=RENDERED_CACHE['html'], headers=headers)
+
+WIND_DIRECTIONS = ("↓ N", "↙ NE", "← E", "↖ SE", "↑ S", "↗ SW", "→ W", "↘ NW")
+# Label for every whole degree; each 45° bucket is centred on its compass point
+WIND_LOOKUP = tuple(WIND_DIRECTIONS[int((d + 22.5) % 360) // 45] for d in range(360))
 
 def wind_direction(degrees):
-    directions = ["↓ N", "↙ NE", "← E", "↖ SE", "↑ S", "↗ SW", "→ W", "↘ NW"]
-    return directions[round((degrees % 360) / 45) % 8]
+    # OpenWeather reports whole degrees, so a direct table lookup is enough
+    return WIND_LOOKUP[int(degrees) % 360]
+
+def render_page(all_data, today):
+    """Fill the page template with one snapshot of weather data"""
+    weather = all_data['current_weather']
+    return WEATHER_TEMPLATE.render(
+        weather=weather,
+        wind_dir=wind_direction(weather["wind_deg"]),
+        sun_moon=all_data['sun_moon'],
+        air_quality=all_data['air_quality'],
+        forecast=all_data['forecast'],
+        rainfall_data=all_data['rainfall_data'],
+        today=today.strftime('%A, %B %d, %Y'),
+        lat=LAT,
+        lon=LON,
+        tile_min_zoom=TILE_MIN_ZOOM,
+        tile_max_zoom=TILE_MAX_ZOOM,
+        tile_radius=TILE_RADIUS,
+        css_version=ASSET_VERSIONS["rainfall.css"],
+        js_version=ASSET_VERSIONS["rainfall.js"]
+    )
+
+def render_cached_page():
+    """Render the page for the data in WEATHER_CACHE and keep it as UTF-8 bytes"""
+    today = datetime.now(TOKYO_TZ)
+    next_midnight = (today + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    html_bytes = render_page(WEATHER_CACHE['data'], today).encode('utf-8')
+    RENDERED_CACHE['html'] = html_bytes
+    # Hash of the page itself, so a refresh that changes nothing visible still gets 304s
+    page_hash = hashlib.blake2b(html_bytes, digest_size=16).hexdigest()
+    RENDERED_CACHE['etag'] = f'"{page_hash}"'
+    # mtime=0 keeps the compressed bytes identical for identical pages
+    RENDERED_CACHE['gzip'] = gzip.compress(html_bytes, compresslevel=9, mtime=0)
+    RENDERED_CACHE['gzip_etag'] = f'"{page_hash}-gzip"'
+    RENDERED_CACHE['timestamp'] = WEATHER_CACHE['timestamp']
+    RENDERED_CACHE['expires_at'] = next_midnight.timestamp()
+
+def is_rendered_page_current():
+    """Check if the rendered page matches the cached data and today's date"""
+    return (RENDERED_CACHE['html'] is not None and
+            RENDERED_CACHE['timestamp'] == WEATHER_CACHE['timestamp'] and
+            time.time() < RENDERED_CACHE['expires_at'])
 
 @app.api_route("/rainfall/formatted", response_class=HTMLResponse, methods=["GET", "HEAD"])
-def rainfall_formatted(request: Request):
-    # Get all data with just 3 API calls instead of 5+
-    all_data = get_all_weather_data()
+async def rainfall_formatted(request: Request):
+    # Get all data with just 3 concurrent API calls instead of 5+ sequential ones
+    all_data = await get_all_weather_data()
     
-    rainfall_data = all_data['rainfall_data']
-    weather = all_data['current_weather']
-    forecast = all_data['forecast']
-    air_quality = all_data['air_quality']
-    sun_moon = all_data['sun_moon']
-    wind_dir = wind_direction(weather["wind_deg"])
+    # The page is rendered whenever the cache refreshes; only re-render after midnight
+    if all_data is WEATHER_CACHE['data']:
+        if not is_rendered_page_current():
+            render_cached_page()
+        return cached_page_response(request)
+    
+    # Fallback page: never cached, so the next visit tries the API again
+    html_content = render_page(all_data, datetime.now(TOKYO_TZ))
+    return HTMLResponse(content=html_content, headers={"Cache-Control": "no-store"})
+
+# Precipitation map tiles are proxied so the API key never reaches the browser
+TILE_URL = "https://tile.openweathermap.org/map/precipitation_new/{z}/{x}/{y}.png"
+TILE_CACHE = OrderedDict()  # (z, x, y) -> (png bytes, expires at), least recently used first
+TILE_CACHE_SIZE = 512       # About 10 MB of mostly transparent PNGs
+TILE_CACHE_DURATION = 3600  # OpenWeather redraws precipitation tiles roughly hourly
+TILE_RATE_LIMIT = "120/minute"  # Per visitor; a full map view is about 20 tiles
+# The overlay only covers the area around LAT/LON (the map never leaves Tokyo), so
+# the proxy can't be used to spend the API key on the rest of the world
+TILE_MIN_ZOOM = 6
+TILE_MAX_ZOOM = 12          # Leaflet scales these up when zoomed in further
+TILE_RADIUS = 1.5           # Degrees of latitude/longitude around LAT/LON
+
+def tile_at(lat, lon, z):
+    """Web Mercator (x, y) of the tile containing a point at zoom z"""
+    n = 2 ** z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return x, y
+
+# Zoom -> (min x, min y, max x, max y) of the tiles covering the overlay area
+TILE_RANGES = {
+    z: tile_at(float(LAT) + TILE_RADIUS, float(LON) - TILE_RADIUS, z) +
+       tile_at(float(LAT) - TILE_RADIUS, float(LON) + TILE_RADIUS, z)
+    for z in range(TILE_MIN_ZOOM, TILE_MAX_ZOOM + 1)
+}
+
+@app.get("/tiles/{z}/{x}/{y}.png")
+@limiter.limit(TILE_RATE_LIMIT)  # slowapi reads the client address from the request parameter
+async def precipitation_tile(request: Request, z: int, x: int, y: int):
+    """Precipitation map tile, cached for an hour"""
+    tile_range = TILE_RANGES.get(z)
+    if tile_range is None:
+        return Response(status_code=404)
+    min_x, min_y, max_x, max_y = tile_range
+    if not (min_x <= x <= max_x and min_y <= y <= max_y):
+        return Response(status_code=404)
+    
+    key = (z, x, y)
+    current_time = time.time()
+    cached = TILE_CACHE.get(key)
+    if cached is not None and current_time < cached[1]:
+        TILE_CACHE.move_to_end(key)
+        png, expires_at = cached
+    else:
+        try:
+            response = await client.get(TILE_URL.format(z=z, x=x, y=y), params={"appid": API_KEY})
+            response.raise_for_status()
+        except Exception as e:
+            logger.error("❌ Error fetching map tile %s/%s/%s: %s", z, x, y, describe_fetch_error(e))
+            return Response(status_code=502, headers={"Cache-Control": "no-store"})
+        
+        png, expires_at = response.content, current_time + TILE_CACHE_DURATION
+        TILE_CACHE[key] = (png, expires_at)
+        TILE_CACHE.move_to_end(key)
+        if len(TILE_CACHE) > TILE_CACHE_SIZE:
+            TILE_CACHE.popitem(last=False)
     
-    html_content = f"""
-    <html>
-        <head>
-            <title>Tokyo Weather</title>
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <link rel="stylesheet" href="https://unpkg.com/leaflet@1.7.1/dist/leaflet.css" />
-            <style>
-                body {{
-                    font-family: 'Arial', sans-serif;
-                    background-image: url('/static/tokyo_fuji.jpg');
-                    background-size: cover;
-                    background-attachment: fixed;
-                    color: white;
-                    margin: 0;
-                    padding: 20px;
-                }}
-                .container {{
-                    max-width: 1000px;
-                    margin: 0 auto;
-                }}
-                .card {{
-                    background: rgba(0, 0, 0, 0.7);
-                    backdrop-filter: blur(5px);
-                    border-radius: 15px;
-                    padding: 25px;
-                    margin-bottom: 20px;
-                    box-shadow: 0 4px 15px rgba(0,0,0,0.2);
-                }}
-                .weather-header {{
-                    display: flex;
-                    align-items: center;
-                    margin-bottom: 20px;
-                }}
-                .weather-icon {{
-                    width: 80px;
-                    height: 80px;
-                    margin-right: 20px;
-                }}
-                .weather-main {{
-                    flex-grow: 1;
-                }}
-                .weather-temp {{
-                    font-size: 2.5em;
-                    font-weight: bold;
-                    margin: 5px 0;
-                }}
-                .weather-desc {{
-                    font-size: 1.2em;
-                    opacity: 0.9;
-                }}
-                .details-grid {{
-                    display: grid;
-                    grid-template-columns: repeat(2, 1fr);
-                    gap: 15px;
-                    margin-top: 20px;
-                }}
-                .detail-item {{
-                    display: flex;
-                    align-items: center;
-                    padding: 10px;
-                    background: rgba(255,255,255,0.1);
-                    border-radius: 8px;
-                }}
-                .detail-icon {{
-                    font-size: 1.5em;
-                    margin-right: 10px;
-                    width: 30px;
-                    text-align: center;
-                }}
-                .forecast-item {{
-                    padding: 12px 0;
-                    border-bottom: 1px solid rgba(255,255,255,0.2);
-                    display: flex;
-                    justify-content: space-between;
-                }}
-                .forecast-item:last-child {{
-                    border-bottom: none;
-                }}
-                h1, h2, h3 {{
-                    margin-top: 0;
-                    text-shadow: 1px 1px 3px rgba(0,0,0,0.5);
-                }}
-                .highlight {{
-                    color: #fff;
-                    font-weight: bold;
-                }}
-                .aqi-display {{
-                    padding: 8px 12px;
-                    border-radius: 20px;
-                    background-color: {air_quality['color']};
-                    display: inline-block;
-                    margin-left: 10px;
-                }}
-                .forecast-container {{
-                    display: flex;
-                    overflow-x: auto;
-                    gap: 15px;
-                    padding: 10px 0;
-                }}
-                .forecast-day {{
-                    min-width: 120px;
-                    text-align: center;
-                    background: rgba(255,255,255,0.1);
-                    padding: 10px;
-                    border-radius: 8px;
-                }}
-                .forecast-day img {{
-                    width: 50px;
-                    height: 50px;
-                }}
-                #map {{
-                    height: 400px;
-                    width: 100%;
-                    border-radius: 10px;
-                    margin-top: 15px;
-                }}
-                table {{
-                    width: 100%;
-                    border-collapse: collapse;
-                    margin: 15px 0;
-                }}
-                th, td {{
-                    padding: 12px;
-                    text-align: left;
-                    border-bottom: 1px solid rgba(255,255,255,0.2);
-                }}
-                th {{
-                    background: rgba(255,255,255,0.1);
-                }}
-                .download-btn {{
-                    display: block;
-                    text-align: center;
-                    margin: 20px auto;
-                    padding: 10px 15px;
-                    background: rgba(0, 100, 200, 0.7);
-                    color: white;
-                    border-radius: 5px;
-                    text-decoration: none;
-                    width: fit-content;
-                }}
-                .download-btn:hover {{
-                    background: rgba(0, 120, 240, 0.9);
-                }}
-                .cache-info {{
-                    background: rgba(0, 150, 0, 0.3);
-                    padding: 10px;
-                    border-radius: 8px;
-                    margin-bottom: 10px;
-                    text-align: center;
-                    font-size: 0.9em;
-                }}
-                .optimization-banner {{
-                    background: rgba(0, 200, 0, 0.8);
-                    color: white;
-                    padding: 10px;
-                    text-align: center;
-                    border-radius: 8px;
-                    margin-bottom: 20px;
-                    font-weight: bold;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                
-               
-                </div>
-                
-                <!-- Current Weather Card -->
-                <div class="card">
-                    <div class="weather-header">
-                        <img class="weather-icon" src="https://openweathermap.org/img/wn/{weather['icon']}@4x.png" alt="Weather icon">
-                   <div class="weather-main">
-                     <h1>Tokyo Weather</h1>
-                     <div style="font-size: 1.1em; opacity: 0.9; margin-bottom: 5px; font-weight: 500;">
-                          {datetime.now(pytz.timezone("Asia/Tokyo")).strftime('%A, %B %d, %Y')}
-                     </div>
-                      <div class="weather-desc">{weather['description']}</div>
-                      <div class="weather-temp">{weather['temp']}°C</div>
-                    </div>
-                    </div>
-                    
-                    <div class="details-grid">
-                        <div class="detail-item">
-                            <div class="detail-icon">💧</div>
-                            <div>Humidity <span class="highlight">{weather['humidity']}%</span></div>
-                        </div>
-                        <div class="detail-item">
-                            <div class="detail-icon">🌬️</div>
-                            <div>Wind <span class="highlight">{weather['wind_speed']} m/s {wind_dir}</span></div>
-                        </div>
-                        <div class="detail-item">
-                            <div class="detail-icon">☀️</div>
-                            <div>Sunrise <span class="highlight">{sun_moon['sunrise']}</span></div>
-                        </div>
-                        <div class="detail-item">
-                            <div class="detail-icon">🌇</div>
-                            <div>Sunset <span class="highlight">{sun_moon['sunset']}</span></div>
-                        </div>
-                        <div class="detail-item">
-                            <div class="detail-icon">🌙</div>
-                            <div>Moon Phase <span class="highlight">{sun_moon['moon']}</span></div>
-                        </div>
-                        <div class="detail-item">
-                            <div class="detail-icon">⏱️</div>
-                            <div>Last Update <span class="highlight">{rainfall_data['current_timestamp']}</span></div>
-                        </div>
-                    </div>
-                </div>
-                
-                <!-- Air Quality Card -->
-                <div class="card">
-                    <h2>Air Quality</h2>
-                    <div style="display: flex; align-items: center;">
-                        <div>Current AQI: </div>
-                        <div class="aqi-display">{air_quality['level']} ({air_quality['aqi']})</div>
-                    </div>
-                    <p>{air_quality['advice']}</p>
-                    
-                    <table>
-                        <tr>
-                            <th>Pollutant</th>
-                            <th>Concentration (μg/m³)</th>
-                        </tr>
-                        <tr>
-                            <td>CO</td>
-                            <td>{air_quality['components'].get('co', 'N/A')}</td>
-                        </tr>
-                        <tr>
-                            <td>NO</td>
-                            <td>{air_quality['components'].get('no', 'N/A')}</td>
-                        </tr>
-                        <tr>
-                            <td>NO₂</td>
-                            <td>{air_quality['components'].get('no2', 'N/A')}</td>
-                        </tr>
-                        <tr>
-                            <td>O₃</td>
-                            <td>{air_quality['components'].get('o3', 'N/A')}</td>
-                        </tr>
-                        <tr>
-                            <td>SO₂</td>
-                            <td>{air_quality['components'].get('so2', 'N/A')}</td>
-                        </tr>
-                        <tr>
-                            <td>PM2.5</td>
-                            <td>{air_quality['components'].get('pm2_5', 'N/A')}</td>
-                        </tr>
-                        <tr>
-                            <td>PM10</td>
-                            <td>{air_quality['components'].get('pm10', 'N/A')}</td>
-                        </tr>
-                    </table>
-                </div>
-                
-                <!-- 5-Day Forecast Card -->
-                <div class="card">
-                    <h2>5-Day Forecast</h2>
-                    <div class="forecast-container">
-                        {"".join(
-                            f'<div class="forecast-day">'
-                            f'<div>{day["date"]}</div>'
-                            f'<img src="https://openweathermap.org/img/wn/{day["icon"]}@2x.png" alt="{day["description"]}">'
-                            f'<div>{day["temp"]}°C</div>'
-                            f'<div style="font-size:0.9em">{day["description"]}</div>'
-                            f'</div>'
-                            for day in forecast
-                        )}
-                    </div>
-                </div>
-                
-                <!-- Rainfall Forecast Card -->
-                <div class="card">
-                    <h2>Rainfall Forecast</h2>
-                    <div class="highlight" style="font-size: 1.2em; margin-bottom: 15px;">
-                        Current: {rainfall_data['current_rainfall_last_hour_mm']} mm
-                    </div>
-                    
-                    <table>
-                        <tr>
-                            <th>Time</th>
-                            <th>Rainfall (mm)</th>
-                        </tr>
-                        {"".join(
-                            f'<tr>'
-                            f'<td>{f["timestamp"]}</td>'
-                            f'<td>{f["rainfall_3h_mm"]} mm</td>'
-                            f'</tr>'
-                            for f in rainfall_data["forecast"]
-                        )}
-                    </table>
-                </div>
-                
-                <!-- Interactive Map Card -->
-                <div class="card">
-                    <h2>Interactive Weather Map</h2>
-                    <p>Precipitation map showing rain intensity in Tokyo area</p>
-                    <div id="map"></div>
-                    <div class="map-legend">
-                        <h3>Rain Intensity</h3>
-                        <div>🔵 Light (0-2mm/h)</div>
-                        <div>🔷 Moderate (2-10mm/h)</div>
-                        <div>🔶 Heavy (10-50mm/h)</div>
-                        <div>🔴 Extreme (>50mm/h)</div>
-                    </div>
-                </div>
-
-                <!-- Download Button -->
-                <a href="/download" class="download-btn">
-                    📥 Download API Source Code
-                </a>
-            </div>
-            
-            <script src="https://unpkg.com/leaflet@1.7.1/dist/leaflet.js"></script>
-            <script>
-                // Initialize map centered on Tokyo
-                var map = L.map('map').setView([{LAT}, {LON}], 11);
-                
-                // Add base map layer
-                L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
-                    attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
-                }}).addTo(map);
-                
-                // Add weather overlay
-                L.tileLayer('https://tile.openweathermap.org/map/precipitation_new/{{z}}/{{x}}/{{y}}.png?appid={API_KEY}', {{
-                    attribution: 'Weather data © OpenWeatherMap',
-                    opacity: 0.7
-                }}).addTo(map);
-                
-                // Add marker for Tokyo location
-                L.marker([{LAT}, {LON}]).addTo(map)
-                    .bindPopup('Tokyo<br>Current Location');
-            </script>
-        </body>
-    </html>
-    """
-    return HTMLResponse(content=html_content)
+    return Response(content=png, media_type="image/png",
+                    headers={"Cache-Control": f"public, max-age={int(expires_at - current_time)}"})
+
+# The source file only changes on redeploy, so stat it once instead of on every download
+SOURCE_STAT = os.stat(__file__)
+# Weak, because GZipMiddleware may send the same file gzipped under this tag
+SOURCE_ETAG = f'W/"{SOURCE_STAT.st_mtime_ns:x}-{SOURCE_STAT.st_size:x}"'
+# Same URL after a redeploy, so browsers revalidate hourly instead of keeping it forever
+DOWNLOAD_HEADERS = {"ETag": SOURCE_ETAG, "Cache-Control": "public, max-age=3600"}
 
 @app.get("/download")
-def download_api():
+async def download_api(request: Request):
     """Download the API source code"""
+    if etag_matches(request, SOURCE_ETAG):
+        return Response(status_code=304, headers=DOWNLOAD_HEADERS)
+    
     return FileResponse(
         path=__file__,
         filename="Tokyo_Weather_API.py",
-        media_type="text/x-python"
+        media_type="text/x-python",
+        stat_result=SOURCE_STAT,
+        headers=DOWNLOAD_HEADERS
     )
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    # "auto" picks uvloop and httptools when installed (uvicorn[standard]); uvloop isn't available on Windows
+    uvicorn.run(
+        "Tokyo_Rainfall_API:app",
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", 8000)),
+        loop="auto",
+        http="auto",
+        # One worker per core; set REDIS_URL so they share one weather cache
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    )
 
 
@@ -0,0 +1,25 @@
+// Location and overlay URL are filled in by the server on the map element
+var mapElement = document.getElementById('map');
+var tokyo = [parseFloat(mapElement.dataset.lat), parseFloat(mapElement.dataset.lon)];
+
+// Initialize map centered on Tokyo
+var map = L.map('map').setView(tokyo, 11);
+
+// Add base map layer
+L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+    attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
+}).addTo(map);
+
+// Add weather overlay; the server only has tiles for this zoom range and area
+var tileRadius = parseFloat(mapElement.dataset.tileRadius);
+L.tileLayer(mapElement.dataset.tiles, {
+    attribution: 'Weather data © OpenWeatherMap',
+    opacity: 0.7,
+    minZoom: parseInt(mapElement.dataset.tileMinZoom, 10),
+    maxNativeZoom: parseInt(mapElement.dataset.tileMaxZoom, 10),
+    bounds: [[tokyo[0] - tileRadius, tokyo[1] - tileRadius], [tokyo[0] + tileRadius, tokyo[1] + tileRadius]]
+}).addTo(map);
+
+// Add marker for Tokyo location
+L.marker(tokyo).addTo(map)
+    .bindPopup('Tokyo<br>Current Location');